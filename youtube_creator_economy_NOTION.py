@@ -4,25 +4,192 @@ YouTube Creator Economy Transcriber - FIXED VERSION WITH RATE LIMITING + ERROR R
 Handles 429 errors AND automatically retries videos with failed transcriptions
 """
 
+import asyncio
+import json
+import logging
+import math
 import os
+import re
+import threading
 import time
 import requests
-from datetime import datetime
-from dateutil import parser
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from urllib.parse import unquote
 from google import genai
 from google.genai import types
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 import random
 
+try:
+    import orjson
+except ImportError:
+    # orjson is an optional speedup; fall back to stdlib json with the same bytes-based API
+    class orjson:
+        @staticmethod
+        def dumps(obj):
+            return json.dumps(obj).encode()
+
+        loads = staticmethod(json.loads)
+
+log = logging.getLogger(__name__)
+
+
+def is_rate_limit_error(error):
+    """Return True if an API error indicates a 429 / quota exhaustion."""
+    return "429" in str(error) or "RESOURCE_EXHAUSTED" in str(error)
+
+
+def retry_after_seconds(error):
+    """Return the retry delay the server asked for, or None if it didn't say."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    retry_after = headers.get('Retry-After')
+    if retry_after:
+        # Either delay-seconds or an HTTP-date; ignore values like "nan" or "inf"
+        try:
+            delay = float(retry_after)
+            if math.isfinite(delay):
+                return max(0.0, delay)
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(retry_after)
+            # A "-0000" zone parses as naive, but HTTP-dates are always UTC
+            if retry_at.tzinfo is None:
+                retry_at = retry_at.replace(tzinfo=timezone.utc)
+            return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            pass
+    
+    # Gemini reports the delay in its RetryInfo detail, e.g. "retryDelay": "37s"
+    match = re.search(r"""retryDelay['"]?\s*:\s*['"](\d+(?:\.\d+)?)s""", str(error))
+    if match:
+        return float(match.group(1))
+    return None
+
+
+TRANSCRIPT_PROMPT = """Return JSON with these keys:
+- summary: a 2-3 sentence summary of the main topics discussed in this video
+- transcript: a complete transcript of this video with:
+  - Paragraph breaks for readability
+  - Speaker labels if multiple speakers
+  - Timestamps where helpful
+  - Mark ads/sponsors as [AD]"""
+
+# One pass over the video yields both fields; built once and shared by every request
+TRANSCRIPT_CONFIG = types.GenerateContentConfig(
+    response_mime_type="application/json",
+    response_schema={
+        "type": "object",
+        "properties": {
+            "summary": {"type": "string"},
+            "transcript": {"type": "string"}
+        },
+        "required": ["summary", "transcript"]
+    }
+)
+
+TRANSCRIPT_HEADER_BLOCKS = [
+    {"object": "block", "type": "heading_1", "heading_1": {"rich_text": [{"text": {"content": "Full Transcript"}}]}},
+    {"object": "block", "type": "divider", "divider": {}}
+]
+
+
+def split_text(text, limit=2000):
+    """Yield chunks of at most limit chars, breaking at a newline or space where possible."""
+    start = 0
+    while start < len(text):
+        end = start + limit
+        if end < len(text):
+            # Look for a paragraph break first, then a word boundary, in the back half of the window
+            cut = text.rfind('\n', start + limit // 2, end)
+            if cut == -1:
+                cut = text.rfind(' ', start + limit // 2, end)
+            if cut != -1:
+                end = cut + 1
+        yield text[start:end]
+        start = end
+
+
+def paragraph_block(text):
+    """Build a Notion paragraph block holding one transcript chunk."""
+    return {"object": "block", "type": "paragraph", "paragraph": {"rich_text": [{"text": {"content": text}}]}}
+
+
+class AsyncRateLimiter:
+    """Enforce a minimum interval between requests shared by concurrent tasks."""
+
+    def __init__(self, rps):
+        self.rps = rps
+        self._next_allowed = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until the next request slot is available."""
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            delay = max(0, self._next_allowed - loop.time())
+            if delay:
+                await asyncio.sleep(delay)
+            self._next_allowed = loop.time() + 1.0 / self.rps
+
+
+class TokenBucket:
+    """Thread-safe token bucket: bursts up to capacity, then refill_per_sec sustained."""
+
+    def __init__(self, capacity, refill_per_sec):
+        self.capacity = capacity
+        self.refill_per_sec = refill_per_sec
+        self.tokens = float(capacity)
+        self.last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, blocking only when the bucket is empty."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.refill_per_sec)
+            self.last_refill = now
+            if self.tokens < 1:
+                time.sleep((1 - self.tokens) / self.refill_per_sec)
+                self.tokens = 1.0
+                self.last_refill = time.monotonic()
+            self.tokens -= 1
+
+
 class YouTubeCreatorEconomyAutomation:
+    # Summaries that mark a failed transcription, matched in a single pass
+    _ERROR_RE = re.compile(
+        r'video transcription failed|rate limit exceeded|error:\s*429|resource_exhausted|transcription failed|error:',
+        re.IGNORECASE
+    )
+
     def __init__(self):
         self.load_env_configs()
-        self.processed_videos_cache, self.error_videos = self.load_processed_videos_from_notion()
         
         # Rate limiting configuration
-        self.request_delay = 3  # Seconds between requests
+        self.gemini_concurrency = int(os.environ.get('GEMINI_CONCURRENCY', '2'))  # Gemini calls in flight
+        self.gemini_sem = asyncio.Semaphore(self.gemini_concurrency)
+        self.gemini_rpm = float(os.environ.get('GEMINI_RPM', '10'))  # Free tier allows ~15 RPM
+        self.gemini_limiter = AsyncRateLimiter(rps=self.gemini_rpm / 60)
         self.max_retries = 3
+        self.youtube_workers = int(os.environ.get('YOUTUBE_WORKERS', '8'))  # Parallel channel fetches
+        self.notion_bucket = TokenBucket(capacity=10, refill_per_sec=3)  # Notion averages ~3 requests/second, with bursts
+        self.notion_sem = asyncio.Semaphore(3)  # Page writes in flight
         self.base_backoff = 5  # Base seconds for exponential backoff
+        self.max_backoff = 60  # Ceiling for a single backoff window
+        
+        # Loading uses the retry settings above
+        self.processed_videos_cache, self.error_videos = self.load_processed_videos_from_notion()
+        self._save_processed_cache()
+        self._prune_transcript_cache()
         
         # Channel @ handles
         self.channel_handles = [
@@ -57,331 +224,411 @@ class YouTubeCreatorEconomyAutomation:
             raise ValueError("Missing required environment variables")
         
         self.gemini_client = genai.Client(api_key=self.gemini_key)
-        self.youtube = build('youtube', 'v3', developerKey=self.youtube_api_key)
-        print("✓ Environment configured")
+        self._youtube_local = threading.local()
+        self.youtube_quota_exhausted = threading.Event()
+        
+        # One pooled session so TCP/TLS connections are reused across Notion calls
+        self.notion_session = requests.Session()
+        self.notion_session.headers.update({
+            "Authorization": f"Bearer {self.notion_token}",
+            "Notion-Version": "2022-06-28",
+            "Content-Type": "application/json"
+        })
+        # Transient 5xx/connection errors retry in the adapter (idempotent methods only);
+        # 429s are handled by _notion_request so Retry-After is logged and honored
+        retries = Retry(total=5, backoff_factor=1, status_forcelist=[500, 502, 503, 504], raise_on_status=False)
+        self.notion_session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=retries))
+        self.cache_dir = Path(os.environ.get('CACHE_DIR', '~/.cache/yt_creator_econ')).expanduser()
+        self.handle_cache = self._load_cache('handle_cache.json', {})
+        self.processed_cache_name = f"processed_{self.notion_database_id}.json"
+        self.transcript_cache_dir = self.cache_dir / 'transcripts'
+        log.info("✓ Environment configured")
 
     def load_processed_videos_from_notion(self):
-        """Load all processed video IDs from Notion and identify ones with errors."""
-        print("\n--- Loading Processed Videos ---")
+        """Load processed video IDs from the local cache plus Notion pages edited since the last sync."""
+        log.info("\n--- Loading Processed Videos ---")
+        cache = {} if os.environ.get('REFRESH_CACHE') else self._load_cache(self.processed_cache_name, {})
+        all_video_ids = set(cache.get('video_ids', []))
+        error_videos = dict(cache.get('error_videos', {}))  # video_id -> page_id for videos with errors
+        self._last_sync = cache.get('last_sync')
+        if all_video_ids:
+            log.info(f"  ✓ Loaded {len(all_video_ids)} videos from local cache")
+        
         try:
             url = f"https://api.notion.com/v1/databases/{self.notion_database_id}/query"
-            headers = {
-                "Authorization": f"Bearer {self.notion_token}",
-                "Notion-Version": "2022-06-28",
-                "Content-Type": "application/json"
-            }
-            
-            all_video_ids = set()
-            error_videos = {}  # video_id -> page_id for videos with errors
-            has_more = True
-            start_cursor = None
-            
-            while has_more:
-                body = {}
+            # Notion rounds last_edited_time to the minute, so overlap the previous sync slightly
+            sync_started = (datetime.now(timezone.utc) - timedelta(minutes=2)).isoformat()
+            
+            # Only fetch the properties we read, not the whole row
+            db_response = self._notion_request("GET", f"https://api.notion.com/v1/databases/{self.notion_database_id}")
+            properties = orjson.loads(db_response.content).get('properties', {})
+            # Property IDs come back URL-encoded; unquote them so requests doesn't encode them twice
+            params = [('filter_properties', unquote(properties[name]['id'])) for name in ('Video ID', 'Summary') if name in properties]
+            
+            def query_page(start_cursor):
+                body = {
+                    "page_size": 100,
+                    "sorts": [{"timestamp": "created_time", "direction": "descending"}]
+                }
+                if self._last_sync:
+                    body["filter"] = {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": self._last_sync}}
                 if start_cursor:
                     body["start_cursor"] = start_cursor
                 
-                response = requests.post(url, headers=headers, json=body)
-                response.raise_for_status()
-                data = response.json()
-                
-                for page in data.get('results', []):
-                    try:
-                        video_id_prop = page['properties'].get('Video ID', {})
-                        if video_id_prop.get('rich_text'):
-                            video_id = video_id_prop['rich_text'][0]['text']['content']
-                            all_video_ids.add(video_id)
-                            
-                            # Check if transcript has errors
-                            summary_prop = page['properties'].get('Summary', {})
-                            if summary_prop.get('rich_text'):
-                                summary = summary_prop['rich_text'][0]['text']['content']
-                                
-                                # Detect error indicators
-                                error_indicators = [
-                                    'Video transcription failed',
-                                    'Rate limit exceeded',
-                                    'Error: 429',
-                                    'RESOURCE_EXHAUSTED',
-                                    'Error:',
-                                    'transcription failed'
-                                ]
-                                
-                                if any(indicator.lower() in summary.lower() for indicator in error_indicators):
-                                    error_videos[video_id] = page['id']
-                                    print(f"  ⚠️  Found error video: {video_id}")
-                    except:
-                        pass
-                
-                has_more = data.get('has_more', False)
-                start_cursor = data.get('next_cursor')
-            
-            print(f"  ✓ Loaded {len(all_video_ids)} processed videos")
-            print(f"  ⚠️  Found {len(error_videos)} videos with errors to retry")
-            return all_video_ids, error_videos
+                response = self._notion_request("POST", url, json=body, params=params)
+                return orjson.loads(response.content)
+            
+            fetched = 0
+            # Pages arrive newest first, so the first page seen for a video decides its error state
+            decided = set()
+            
+            # Fetch the next page in the background while the current one is parsed
+            with ThreadPoolExecutor(max_workers=1) as prefetcher:
+                next_page = prefetcher.submit(query_page, None)
+                while next_page:
+                    data = next_page.result()
+                    next_page = prefetcher.submit(query_page, data.get('next_cursor')) if data.get('has_more') else None
+                    
+                    for page in data.get('results', []):
+                        page_props = page['properties']
+                        video_id_text = page_props.get('Video ID', {}).get('rich_text')
+                        if not video_id_text:
+                            continue
+                        video_id = video_id_text[0]['text']['content']
+                        all_video_ids.add(video_id)
+                        fetched += 1
+                        
+                        if video_id in decided:
+                            continue
+                        decided.add(video_id)
+                        
+                        # Check if transcript has errors
+                        summary_text = page_props.get('Summary', {}).get('rich_text')
+                        if summary_text:
+                            summary = summary_text[0]['text']['content']
+                            if self._ERROR_RE.search(summary):
+                                error_videos[video_id] = page['id']
+                                log.debug(f"  ⚠️  Found error video: {video_id}")
+                            else:
+                                # Fixed since the last sync
+                                error_videos.pop(video_id, None)
+            
+            self._last_sync = sync_started
+            log.info(f"  ✓ Synced {fetched} pages from Notion")
             
         except Exception as e:
-            print(f"  Warning: {e}")
-            return set(), {}
+            # Without a previous sync there is nothing to fall back on, and every video would look new
+            if not self._last_sync:
+                log.error(f"  ✗ Initial Notion sync failed: {e}")
+                raise
+            log.warning(f"  Warning: {e}")
+        
+        log.info(f"  ✓ Loaded {len(all_video_ids)} processed videos")
+        if error_videos:
+            log.warning(f"  ⚠️  Found {len(error_videos)} videos with errors to retry")
+        else:
+            log.info(f"  ✓ Found 0 videos with errors to retry")
+        return all_video_ids, error_videos
+
+    def find_existing_video_ids(self, video_ids):
+        """Return the subset of video_ids that already have a page in Notion."""
+        url = f"https://api.notion.com/v1/databases/{self.notion_database_id}/query"
+        video_ids = list(video_ids)
+        existing = set()
+        
+        # One compound "or" query confirms up to 100 candidates at a time
+        for i in range(0, len(video_ids), 100):
+            body = {
+                "filter": {"or": [{"property": "Video ID", "rich_text": {"equals": video_id}} for video_id in video_ids[i:i + 100]]},
+                "page_size": 100
+            }
+            while True:
+                response = self._notion_request("POST", url, json=body)
+                data = orjson.loads(response.content)
+                for page in data.get('results', []):
+                    video_id_text = page['properties'].get('Video ID', {}).get('rich_text')
+                    if video_id_text:
+                        existing.add(video_id_text[0]['text']['content'])
+                if not data.get('has_more'):
+                    break
+                body["start_cursor"] = data.get('next_cursor')
+        
+        return existing
 
-    def get_channel_videos_by_handle(self, handle, max_results=50):
-        """Get latest videos from a YouTube channel using @ handle."""
+    def _save_processed_cache(self):
+        """Persist processed video IDs and error pages so the next run only syncs the delta."""
+        self._save_cache(self.processed_cache_name, {
+            'video_ids': sorted(self.processed_videos_cache),
+            'error_videos': self.error_videos,
+            'last_sync': self._last_sync
+        })
+
+    def _prune_transcript_cache(self):
+        """Delete cached transcripts for videos that already have a good page in Notion."""
+        # A page can land in Notion even when the run fails before its own cleanup
         try:
-            # Get the channel ID from the handle
-            search_response = self.youtube.search().list(
-                part='snippet',
-                q=handle,
-                type='channel',
-                maxResults=1
-            ).execute()
-            
-            if not search_response.get('items'):
-                print(f"  Channel not found: {handle}")
-                return []
-            
-            channel_id = search_response['items'][0]['snippet']['channelId']
-            channel_title = search_response['items'][0]['snippet']['title']
-            
-            # Get the uploads playlist ID
-            channel_response = self.youtube.channels().list(
-                part='contentDetails',
-                id=channel_id
-            ).execute()
-            
-            uploads_playlist_id = channel_response['items'][0]['contentDetails']['relatedPlaylists']['uploads']
-            
-            # Get videos from uploads playlist
-            playlist_response = self.youtube.playlistItems().list(
-                part='snippet',
-                playlistId=uploads_playlist_id,
-                maxResults=max_results
+            for path in self.transcript_cache_dir.glob('*.json'):
+                if path.stem in self.processed_videos_cache and path.stem not in self.error_videos:
+                    path.unlink(missing_ok=True)
+        except OSError as e:
+            log.warning(f"  Warning: could not prune transcript cache: {e}")
+
+    def _load_cache(self, name, default):
+        """Load a JSON cache file from the local cache directory."""
+        try:
+            with open(self.cache_dir / name) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return default
+
+    def _save_cache(self, name, data):
+        """Atomically write a JSON cache file to the local cache directory."""
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.cache_dir / f"{name}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.cache_dir / name)
+        except OSError as e:
+            log.warning(f"  Warning: could not write cache {name}: {e}")
+
+    def _youtube_client(self):
+        """Return a YouTube client for the current thread (googleapiclient is not thread-safe)."""
+        if not hasattr(self._youtube_local, 'client'):
+            self._youtube_local.client = build('youtube', 'v3', developerKey=self.youtube_api_key)
+        return self._youtube_local.client
+
+    def _log_youtube_error(self, handle, e):
+        """Report a YouTube API failure, tripping the quota flag on 403 quotaExceeded."""
+        if isinstance(e, HttpError) and e.resp.status == 403 and 'quotaExceeded' in str(e):
+            # Every later call fails the same way until the daily quota resets
+            if not self.youtube_quota_exhausted.is_set():
+                log.warning(f"  ⚠️  YouTube quota exceeded at {handle} - skipping remaining channels")
+            self.youtube_quota_exhausted.set()
+        else:
+            log.warning(f"  Error getting videos for {handle}: {e}")
+
+    def resolve_channel_handle(self, handle):
+        """Resolve an @ handle to its channel title and uploads playlist (1 quota unit, cached across runs)."""
+        channel = self.handle_cache.get(handle)
+        if channel or self.youtube_quota_exhausted.is_set():
+            return channel
+        
+        try:
+            channel_response = self._youtube_client().channels().list(
+                part='snippet,contentDetails',
+                forHandle=handle
             ).execute()
             
-            videos = []
-            for item in playlist_response.get('items', []):
-                video_id = item['snippet']['resourceId']['videoId']
-                videos.append({
-                    'video_id': video_id,
-                    'title': item['snippet']['title'],
-                    'channel': channel_title,
-                    'published': item['snippet']['publishedAt']
-                })
+            if not channel_response.get('items'):
+                log.warning(f"  Channel not found: {handle}")
+                return None
             
-            return videos
+            item = channel_response['items'][0]
+            channel = {
+                'title': item['snippet']['title'],
+                'uploads_playlist_id': item['contentDetails']['relatedPlaylists']['uploads']
+            }
+            self.handle_cache[handle] = channel
+            return channel
         except Exception as e:
-            print(f"  Error getting videos for {handle}: {e}")
-            return []
-
-    def exponential_backoff_delay(self, retry_count):
-        """Calculate exponential backoff delay with jitter."""
-        delay = self.base_backoff * (2 ** retry_count)
-        jitter = random.uniform(0, 1)
-        total_delay = delay + jitter
-        print(f"  ⏳ Backing off for {total_delay:.1f} seconds (attempt {retry_count + 1}/{self.max_retries})")
-        time.sleep(total_delay)
-
-    def transcribe_youtube_url(self, video_url, retry_count=0):
-        """Transcribe YouTube video with rate limiting and retry logic."""
-        try:
-            print(f"  Transcribing from YouTube URL...")
-            
-            # Rate limit delay before making request
-            if retry_count == 0:
-                time.sleep(self.request_delay)
-            
-            # Get summary
-            summary_prompt = f"Provide a 2-3 sentence summary of the main topics discussed in this video."
-            
+            self._log_youtube_error(handle, e)
+            return None
+
+    @staticmethod
+    def _playlist_videos(channel, playlist_response):
+        """Convert a playlistItems.list response into video info dicts."""
+        videos = []
+        for item in playlist_response.get('items', []):
+            video_id = item['snippet']['resourceId']['videoId']
+            videos.append({
+                'video_id': video_id,
+                'title': item['snippet']['title'],
+                'channel': channel['title'],
+                'published': item['snippet']['publishedAt']
+            })
+        return videos
+
+    def backoff_delay(self, retry_count, retry_after=None):
+        """Calculate a full-jitter exponential backoff delay, preferring the server's Retry-After."""
+        if retry_after is not None:
+            # The server knows when quota refills; only add enough jitter to avoid a thundering herd.
+            # Still bound it so a bad header can't park a worker indefinitely
+            total_delay = min(max(0.0, retry_after), self.max_backoff) + random.uniform(0, 0.5)
+        else:
+            # Full jitter spreads concurrent retries across the whole window
+            cap = min(self.base_backoff * (2 ** retry_count), self.max_backoff)
+            total_delay = random.uniform(0, cap)
+        log.info(f"  ⏳ Backing off for {total_delay:.1f} seconds (attempt {retry_count + 1}/{self.max_retries})")
+        return total_delay
+
+    async def exponential_backoff_delay(self, retry_count, retry_after=None):
+        """Sleep for the backoff delay without blocking other tasks."""
+        await asyncio.sleep(self.backoff_delay(retry_count, retry_after))
+
+    async def _generate_from_url_async(self, video_url, video_id, prompt, config=None):
+        """Run a single Gemini prompt against a YouTube URL, retrying on rate limits."""
+        for attempt in range(self.max_retries + 1):
             try:
-                summary_response = self.gemini_client.models.generate_content(
-                    model="gemini-2.5-flash",
-                    contents=[
-                        types.Content(
-                            parts=[
-                                types.Part(file_data=types.FileData(file_uri=video_url)),
-                                types.Part(text=summary_prompt)
-                            ]
-                        )
-                    ]
-                )
-                summary = summary_response.text.strip()
+                async with self.gemini_sem:
+                    await self.gemini_limiter.acquire()
+                    response = await self.gemini_client.aio.models.generate_content(
+                        model="gemini-2.5-flash",
+                        contents=[
+                            types.Content(
+                                parts=[
+                                    types.Part(file_data=types.FileData(file_uri=video_url)),
+                                    types.Part(text=prompt)
+                                ]
+                            )
+                        ],
+                        config=config
+                    )
+                return response.text
             except Exception as e:
-                if "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e):
-                    if retry_count < self.max_retries:
-                        print(f"  ⚠️  Rate limit hit on summary. Retrying...")
-                        self.exponential_backoff_delay(retry_count)
-                        return self.transcribe_youtube_url(video_url, retry_count + 1)
-                    else:
-                        print(f"  ✗ Max retries reached for summary")
-                        raise
-                else:
+                if not is_rate_limit_error(e):
                     raise
+                if attempt == self.max_retries:
+                    log.error(f"  [{video_id}] ✗ Max retries reached")
+                    raise
+                log.warning(f"  [{video_id}] ⚠️  Rate limit hit. Retrying...")
+                # Sleep outside the semaphore so other videos keep their slots
+                await self.exponential_backoff_delay(attempt, retry_after_seconds(e))
+
+    async def transcribe_youtube_url_async(self, video_url, video_id):
+        """Transcribe YouTube video with bounded concurrency and retry logic."""
+        # Reuse a transcript from a run that crashed before its Notion write
+        cache_path = self.transcript_cache_dir / f"{video_id}.json"
+        if cache_path.exists():
+            try:
+                result = orjson.loads(cache_path.read_bytes())
+                log.info(f"  [{video_id}] ✓ Using cached transcript")
+                return result
+            except (OSError, ValueError):
+                pass
+        
+        try:
+            log.debug(f"  [{video_id}] Transcribing from YouTube URL...")
             
-            # Add delay between API calls
-            time.sleep(self.request_delay)
-            
-            # Get transcript
-            transcript_prompt = """Generate a complete transcript of this video with:
-- Paragraph breaks for readability
-- Speaker labels if multiple speakers
-- Timestamps where helpful
-- Mark ads/sponsors as [AD]"""
+            response_text = await self._generate_from_url_async(video_url, video_id, TRANSCRIPT_PROMPT, TRANSCRIPT_CONFIG)
+            result = orjson.loads(response_text)
+            summary = result['summary'].strip()
+            transcript = result['transcript']
             
+            log.info(f"  [{video_id}] ✓ Transcript generated")
+            result = {'summary': summary, 'transcript': transcript}
             try:
-                transcript_response = self.gemini_client.models.generate_content(
-                    model="gemini-2.5-flash",
-                    contents=[
-                        types.Content(
-                            parts=[
-                                types.Part(file_data=types.FileData(file_uri=video_url)),
-                                types.Part(text=transcript_prompt)
-                            ]
-                        )
-                    ]
-                )
-                transcript = transcript_response.text
-            except Exception as e:
-                if "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e):
-                    if retry_count < self.max_retries:
-                        print(f"  ⚠️  Rate limit hit on transcript. Retrying...")
-                        self.exponential_backoff_delay(retry_count)
-                        return self.transcribe_youtube_url(video_url, retry_count + 1)
-                    else:
-                        print(f"  ✗ Max retries reached for transcript")
-                        raise
-                else:
-                    raise
-            
-            print("  ✓ Transcript generated")
-            return {'summary': summary, 'transcript': transcript}
+                self.transcript_cache_dir.mkdir(parents=True, exist_ok=True)
+                cache_path.write_bytes(orjson.dumps(result))
+            except OSError as e:
+                log.warning(f"  [{video_id}] Warning: could not cache transcript: {e}")
+            return result
             
         except Exception as e:
-            error_msg = str(e)
-            if "429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg:
-                print(f"  ✗ Rate limit error after retries: {e}")
+            if is_rate_limit_error(e):
+                log.error(f"  [{video_id}] ✗ Rate limit error after retries: {e}")
                 return {
                     'summary': 'Video transcription failed due to rate limits. Will retry later.',
                     'transcript': f'Error: Rate limit exceeded. Video ID preserved for retry.'
                 }
             else:
-                print(f"  ✗ Error: {e}")
+                log.error(f"  [{video_id}] ✗ Transcription error: {e}")
                 return {
                     'summary': 'Video transcription failed.',
                     'transcript': f'Error: {str(e)}'
                 }
 
-    def update_notion_page(self, page_id, summary, transcript):
-        """Update an existing Notion page with new transcript."""
+    def _notion_request(self, method, url, **kwargs):
+        """Send a Notion API request, retrying 429 responses after the server's Retry-After."""
+        # orjson serializes large block payloads several times faster than stdlib json
+        if 'json' in kwargs:
+            kwargs['data'] = orjson.dumps(kwargs.pop('json'))
+        
+        for attempt in range(self.max_retries + 1):
+            self.notion_bucket.acquire()
+            response = self.notion_session.request(method, url, **kwargs)
+            try:
+                response.raise_for_status()
+                return response
+            except requests.HTTPError as e:
+                if e.response.status_code != 429 or attempt == self.max_retries:
+                    raise
+                log.warning(f"  ⚠️  Notion rate limit hit on {method} {url}. Retrying...")
+                time.sleep(self.backoff_delay(attempt, retry_after_seconds(e)))
+
+    @staticmethod
+    def _iter_transcript_blocks(transcript):
+        """Yield the heading, divider and paragraph blocks for a transcript."""
+        yield from TRANSCRIPT_HEADER_BLOCKS
+        for chunk in split_text(transcript):
+            yield paragraph_block(chunk)
+
+    def _append_block_batches(self, page_id, blocks):
+        """Append blocks to a page 100 at a time, in order, paced by the Notion token bucket."""
+        appended = 0
+        while batch := list(islice(blocks, 100)):
+            self._notion_request("PATCH", f"https://api.notion.com/v1/blocks/{page_id}/children", json={"children": batch})
+            appended += len(batch)
+        return appended
+
+    def _archive_page(self, page_id):
+        """Archive a Notion page, returning False instead of raising if Notion refuses."""
         try:
-            print("  → Updating existing Notion page...")
-            
-            headers = {
-                "Authorization": f"Bearer {self.notion_token}",
-                "Content-Type": "application/json",
-                "Notion-Version": "2022-06-28"
-            }
-            
-            # Update the properties
-            if len(summary) > 2000:
-                summary = summary[:1997] + "..."
-            
-            update_data = {
-                "properties": {
-                    "Summary": {"rich_text": [{"text": {"content": summary}}]}
-                }
-            }
-            
-            response = requests.patch(f"https://api.notion.com/v1/pages/{page_id}", headers=headers, json=update_data)
-            response.raise_for_status()
-            
-            # Get existing blocks
-            blocks_response = requests.get(f"https://api.notion.com/v1/blocks/{page_id}/children", headers=headers)
-            blocks_response.raise_for_status()
-            existing_blocks = blocks_response.json().get('results', [])
-            
-            # Delete all existing blocks (transcript content)
-            for block in existing_blocks:
-                if block['type'] != 'child_page':
-                    try:
-                        requests.delete(f"https://api.notion.com/v1/blocks/{block['id']}", headers=headers)
-                    except:
-                        pass
-            
-            time.sleep(0.5)
-            
-            # Add new transcript
-            chunks = []
-            for i in range(0, len(transcript), 2000):
-                chunks.append({
-                    "object": "block",
-                    "type": "paragraph",
-                    "paragraph": {"rich_text": [{"text": {"content": transcript[i:i + 2000]}}]}
-                })
-            
-            new_blocks = [
-                {"object": "block", "type": "heading_1", "heading_1": {"rich_text": [{"text": {"content": "Full Transcript"}}]}},
-                {"object": "block", "type": "divider", "divider": {}}
-            ]
-            new_blocks.extend(chunks[:98])
-            
-            # Add initial blocks
-            add_response = requests.patch(
-                f"https://api.notion.com/v1/blocks/{page_id}/children",
-                headers=headers,
-                json={"children": new_blocks}
+            self._notion_request("PATCH", f"https://api.notion.com/v1/pages/{page_id}", json={"archived": True})
+            return True
+        except requests.RequestException as e:
+            log.warning(f"  ⚠️  Could not archive page {page_id}: {e}")
+            return False
+
+    def update_notion_page(self, video_id, page_id, summary, transcript):
+        """Replace a failed Notion page with a fresh one carrying the new transcript."""
+        try:
+            log.debug(f"  [{video_id}] → Replacing failed Notion page...")
+            
+            # Carry the original metadata over to the new page
+            response = self._notion_request("GET", f"https://api.notion.com/v1/pages/{page_id}")
+            properties = orjson.loads(response.content)['properties']
+            
+            def plain_text(name, kind='rich_text'):
+                return ''.join(part.get('plain_text', '') for part in properties.get(name, {}).get(kind) or [])
+            
+            published = (properties.get('Date', {}).get('date') or {}).get('start', '')
+            url = self.add_to_notion(
+                plain_text('Channel', 'title'),
+                plain_text('Title'),
+                published,
+                video_id,
+                summary,
+                transcript
             )
-            add_response.raise_for_status()
             
-            print(f"  ✓ Updated page")
+            # Archive the broken page only once its replacement exists (one call instead of N block deletes);
+            # the new page is already saved, so a failed archive doesn't fail the video
+            if self._archive_page(page_id):
+                log.debug(f"  [{video_id}] ✓ Archived failed page")
             
-            # Add remaining blocks if needed
-            remaining = chunks[98:]
-            if remaining:
-                print(f"  → Appending {len(remaining)} more blocks...")
-                for i in range(0, len(remaining), 100):
-                    batch = remaining[i:i + 100]
-                    requests.patch(f"https://api.notion.com/v1/blocks/{page_id}/children", headers=headers, json={"children": batch}).raise_for_status()
-                    time.sleep(0.3)
-                print(f"  ✓ Full transcript updated")
-            
-            return True
+            return url
             
         except Exception as e:
-            print(f"  ✗ Update failed: {e}")
+            log.error(f"  [{video_id}] ✗ Update failed: {e}")
             raise
 
     def add_to_notion(self, channel, title, published, video_id, summary, transcript):
         """Add video to Notion with full transcript."""
         try:
-            print("  → Adding to Notion...")
+            log.debug(f"  [{video_id}] → Adding to Notion...")
             
+            # YouTube's publishedAt is always ISO 8601, e.g. 2024-01-15T12:34:56Z
             try:
-                notion_date = parser.parse(published).strftime('%Y-%m-%d')
-            except:
+                notion_date = datetime.fromisoformat(published.replace('Z', '+00:00')).strftime('%Y-%m-%d')
+            except (AttributeError, ValueError):
                 notion_date = datetime.now().strftime('%Y-%m-%d')
             
             if len(summary) > 2000:
                 summary = summary[:1997] + "..."
             
-            chunks = []
-            for i in range(0, len(transcript), 2000):
-                chunks.append({
-                    "object": "block",
-                    "type": "paragraph",
-                    "paragraph": {"rich_text": [{"text": {"content": transcript[i:i + 2000]}}]}
-                })
-            
-            headers = {
-                "Authorization": f"Bearer {self.notion_token}",
-                "Content-Type": "application/json",
-                "Notion-Version": "2022-06-28"
-            }
-            
-            initial_blocks = [
-                {"object": "block", "type": "heading_1", "heading_1": {"rich_text": [{"text": {"content": "Full Transcript"}}]}},
-                {"object": "block", "type": "divider", "divider": {}}
-            ]
-            initial_blocks.extend(chunks[:98])
+            # Notion accepts at most 100 children when creating a page
+            blocks = self._iter_transcript_blocks(transcript)
             
             video_url = f"https://www.youtube.com/watch?v={video_id}"
             
@@ -395,144 +642,245 @@ class YouTubeCreatorEconomyAutomation:
                     "Video ID": {"rich_text": [{"text": {"content": video_id}}]},
                     "URL": {"url": video_url}
                 },
-                "children": initial_blocks
+                "children": list(islice(blocks, 100))
             }
             
-            response = requests.post("https://api.notion.com/v1/pages", headers=headers, json=create_data)
-            response.raise_for_status()
+            response = self._notion_request("POST", "https://api.notion.com/v1/pages", json=create_data)
             
-            page = response.json()
+            page = orjson.loads(response.content)
             page_id = page['id']
             
-            print(f"  ✓ Created page")
+            log.debug(f"  [{video_id}] ✓ Created page")
             
-            remaining = chunks[98:]
-            if remaining:
-                print(f"  → Appending {len(remaining)} more blocks...")
-                for i in range(0, len(remaining), 100):
-                    batch = remaining[i:i + 100]
-                    requests.patch(f"https://api.notion.com/v1/blocks/{page_id}/children", headers=headers, json={"children": batch}).raise_for_status()
-                    time.sleep(0.3)
-                print(f"  ✓ Full transcript added")
+            # Whatever did not fit in the create call is streamed out in further batches
+            try:
+                appended = self._append_block_batches(page_id, blocks)
+            except Exception:
+                # A truncated page would pass for a finished one, so take it down and let the video be retried
+                self._archive_page(page_id)
+                raise
+            if appended:
+                log.debug(f"  [{video_id}] ✓ Full transcript added")
             
             return page.get('url', '')
             
         except Exception as e:
-            print(f"  ✗ Failed: {e}")
+            log.error(f"  [{video_id}] ✗ Notion write failed: {e}")
             raise
 
-    def process_video(self, video_info, is_retry=False):
+    async def process_video_async(self, video_info, is_retry=False):
         """Process a single YouTube video."""
         video_id = video_info['video_id']
         title = video_info['title']
         
         # Skip if already successfully processed (not in error list)
         if video_id in self.processed_videos_cache and video_id not in self.error_videos:
-            print(f"  Already processed: {title}")
+            log.debug(f"  [{video_id}] Already processed: {title}")
             return False
         
         retry_label = " [RETRY]" if is_retry else ""
-        print(f"\n{'='*80}\nProcessing{retry_label}: {title}\n{'='*80}")
+        log.info(f"▶️  [{video_id}] Processing{retry_label}: {title}")
         
         try:
             video_url = f"https://www.youtube.com/watch?v={video_id}"
             
-            # Transcribe with rate limiting
-            result = self.transcribe_youtube_url(video_url)
+            # Transcribe with bounded concurrency
+            result = await self.transcribe_youtube_url_async(video_url, video_id)
             
             # Check if transcription actually failed due to rate limits
             if "Rate limit exceeded" in result['transcript']:
-                print(f"  ⚠️  Skipping due to rate limits - will process later")
+                log.warning(f"  [{video_id}] ⚠️  Skipping due to rate limits - will process later")
                 return False
             
-            # Update or create in Notion
-            if video_id in self.error_videos:
-                # Update existing page
-                page_id = self.error_videos[video_id]
-                self.update_notion_page(page_id, result['summary'], result['transcript'])
-                # Remove from error list
-                del self.error_videos[video_id]
-            else:
-                # Create new page
-                self.add_to_notion(
-                    video_info['channel'],
-                    title,
-                    video_info['published'],
-                    video_id,
-                    result['summary'],
-                    result['transcript']
-                )
+            # Update or create in Notion; writes overlap other videos' Gemini calls
+            async with self.notion_sem:
+                if video_id in self.error_videos:
+                    # Replace the failed page
+                    page_id = self.error_videos[video_id]
+                    await asyncio.to_thread(self.update_notion_page, video_id, page_id, result['summary'], result['transcript'])
+                    # Remove from error list
+                    del self.error_videos[video_id]
+                else:
+                    # Create new page
+                    await asyncio.to_thread(
+                        self.add_to_notion,
+                        video_info['channel'],
+                        title,
+                        video_info['published'],
+                        video_id,
+                        result['summary'],
+                        result['transcript']
+                    )
             
             self.processed_videos_cache.add(video_id)
-            print(f"  ✓ SUCCESS")
+            self._save_processed_cache()
+            # Saved in Notion now, so the crash-recovery copy is no longer needed
+            (self.transcript_cache_dir / f"{video_id}.json").unlink(missing_ok=True)
+            log.info(f"  [{video_id}] ✓ SUCCESS")
             return True
             
         except Exception as e:
-            print(f"  ✗ FAILED: {e}")
+            log.error(f"  [{video_id}] ✗ FAILED: {e}")
             return False
 
+    def fetch_all_channel_videos(self, max_results=50):
+        """List recent videos for every channel handle, keeping only ones not yet processed."""
+        all_videos = []
+        listed = 0
+        
+        # Resolve handles from a thread pool; cached ones return immediately
+        with ThreadPoolExecutor(max_workers=self.youtube_workers) as executor:
+            resolved = executor.map(self.resolve_channel_handle, self.channel_handles)
+            channels = {handle: channel for handle, channel in zip(self.channel_handles, resolved) if channel}
+        
+        def collect(handle, response, exception):
+            nonlocal listed
+            if exception:
+                self._log_youtube_error(handle, exception)
+                return
+            # An exception here would abort the rest of the batch, so contain it to this channel
+            try:
+                videos = self._playlist_videos(channels[handle], response)
+            except Exception as e:
+                log.warning(f"  Error reading videos for {handle}: {e}")
+                return
+            # Drop already-processed videos here so only candidates are kept
+            new_videos = [v for v in videos if v['video_id'] not in self.processed_videos_cache]
+            listed += len(videos)
+            all_videos.extend(new_videos)
+            log.info(f"  {handle}: found {len(videos)} videos, {len(new_videos)} new")
+        
+        # playlistItems.list takes one playlist per call, but a batch request sends
+        # them all in a single HTTP round trip
+        handles = list(channels)
+        for i in range(0, len(handles), 50):
+            if self.youtube_quota_exhausted.is_set():
+                break
+            # A failed batch skips only its own channels
+            try:
+                youtube = self._youtube_client()
+                batch = youtube.new_batch_http_request(callback=collect)
+                for handle in handles[i:i + 50]:
+                    batch.add(
+                        youtube.playlistItems().list(
+                            part='snippet',
+                            playlistId=channels[handle]['uploads_playlist_id'],
+                            maxResults=max_results,
+                            fields='items/snippet(title,publishedAt,resourceId/videoId)'
+                        ),
+                        request_id=handle
+                    )
+                batch.execute()
+            except Exception as e:
+                log.warning(f"  Error listing channel batch: {e}")
+        
+        self._save_cache('handle_cache.json', self.handle_cache)
+        log.info(f"\n📊 Videos listed: {listed}")
+        log.info(f"📊 Already processed: {listed - len(all_videos)}")
+        if self.youtube_quota_exhausted.is_set():
+            log.warning(f"  ⚠️  Continuing with {len(all_videos)} new videos listed before the quota ran out")
+        return all_videos
+
+    async def _gather_with_progress(self, coros, desc):
+        """Gather coroutines concurrently, logging a progress line as each one finishes."""
+        completed = 0
+        
+        async def track(coro):
+            nonlocal completed
+            result = await coro
+            completed += 1
+            log.info(f"📈 {desc}: {completed}/{len(coros)} complete")
+            return result
+        
+        return await asyncio.gather(*[track(coro) for coro in coros])
+
     def run(self):
-        """Main loop with rate limiting and error retry."""
-        print("\n" + "="*80)
-        print("YOUTUBE CREATOR ECONOMY TRANSCRIBER - RATE LIMITED + ERROR RETRY")
-        print("="*80)
-        print(f"⏱️  Request delay: {self.request_delay}s between videos")
-        print(f"🔄 Max retries: {self.max_retries} with exponential backoff")
+        """Entry point: run the async pipeline to completion."""
+        asyncio.run(self.run_async())
+
+    async def run_async(self):
+        """Main loop with bounded concurrency and error retry."""
+        log.info("\n" + "="*80)
+        log.info("YOUTUBE CREATOR ECONOMY TRANSCRIBER - RATE LIMITED + ERROR RETRY")
+        log.info("="*80)
+        log.info(f"⚡ Gemini concurrency: {self.gemini_concurrency} requests in flight")
+        log.info(f"⏱️  Gemini rate limit: {self.gemini_rpm:g} requests/minute")
+        log.info(f"🔄 Max retries: {self.max_retries} with exponential backoff")
         
         total = 0
-        all_videos = []
+        
+        # List channels in the background while the error retries run
+        log.info(f"\n{'*'*80}\n📥 FETCHING NEW VIDEOS\n{'*'*80}")
+        fetch_task = asyncio.create_task(asyncio.to_thread(self.fetch_all_channel_videos))
         
         # First, retry any videos with errors
         if self.error_videos:
-            print(f"\n{'*'*80}\n🔄 RETRYING {len(self.error_videos)} VIDEOS WITH ERRORS\n{'*'*80}")
+            log.info(f"\n{'*'*80}\n🔄 RETRYING {len(self.error_videos)} VIDEOS WITH ERRORS\n{'*'*80}")
             
-            for video_id, page_id in list(self.error_videos.items()):
-                # We need to get video info - create minimal info object
-                video_info = {
+            # We need to get video info - create minimal info objects
+            retry_videos = [
+                {
                     'video_id': video_id,
                     'title': f'Video {video_id} (retry)',
                     'channel': 'Unknown',
                     'published': datetime.now().isoformat()
                 }
-                
-                if self.process_video(video_info, is_retry=True):
-                    total += 1
-                time.sleep(self.request_delay)
+                for video_id in list(self.error_videos)
+            ]
+            
+            results = await self._gather_with_progress([self.process_video_async(v, is_retry=True) for v in retry_videos], "Retries")
+            total += sum(results)
         
         # Then process new videos
-        print(f"\n{'*'*80}\n📥 FETCHING NEW VIDEOS\n{'*'*80}")
+        try:
+            all_videos = await fetch_task
+        except Exception as e:
+            log.error(f"  ✗ Could not list channel videos: {e}")
+            all_videos = []
         
-        for handle in self.channel_handles:
+        # Dedupe across channels and re-check the cache, since the error retries
+        # ran while the listing was in flight
+        seen = set()
+        unprocessed_videos = []
+        for video in all_videos:
+            video_id = video['video_id']
+            if video_id in seen:
+                continue
+            seen.add(video_id)
+            if video_id not in self.processed_videos_cache:
+                unprocessed_videos.append(video)
+        
+        log.info(f"📊 New candidate videos: {len(unprocessed_videos)}")
+        
+        # Confirm candidates against Notion so a stale local cache can't create duplicate pages
+        if unprocessed_videos:
             try:
-                print(f"\n{'#'*80}\nChannel: {handle}\n{'#'*80}")
-                videos = self.get_channel_videos_by_handle(handle, max_results=50)
-                all_videos.extend(videos)
-                print(f"  Found {len(videos)} videos")
+                existing = await asyncio.to_thread(self.find_existing_video_ids, [v['video_id'] for v in unprocessed_videos])
             except Exception as e:
-                print(f"  Error: {e}")
-        
-        unique_videos = {v['video_id']: v for v in all_videos}.values()
-        unprocessed_videos = [v for v in unique_videos if v['video_id'] not in self.processed_videos_cache or v['video_id'] in self.error_videos]
+                log.warning(f"  Warning: could not check candidates against Notion: {e}")
+                existing = set()
+            if existing:
+                log.info(f"📊 Already in Notion but missing from cache: {len(existing)}")
+                self.processed_videos_cache.update(existing)
+                self._save_processed_cache()
+                unprocessed_videos = [v for v in unprocessed_videos if v['video_id'] not in existing]
         
-        print(f"\n📊 Total unique videos: {len(unique_videos)}")
-        print(f"📊 Already processed: {len(unique_videos) - len(unprocessed_videos)}")
-        print(f"📊 To process: {len(unprocessed_videos)}")
+        log.info(f"📊 To process: {len(unprocessed_videos)}")
         
         if unprocessed_videos:
-            estimated_time = len(unprocessed_videos) * (self.request_delay * 2 + 5)
-            print(f"⏱️  Estimated time: ~{estimated_time // 60} minutes")
+            # One Gemini request per video, paced by the rate limiter
+            estimated_time = len(unprocessed_videos) / self.gemini_rpm
+            log.info(f"⏱️  Estimated time: ~{estimated_time:.0f} minutes")
         
-        for video in unprocessed_videos:
-            if self.process_video(video):
-                total += 1
-            # Additional delay between videos
-            time.sleep(self.request_delay)
+        results = await self._gather_with_progress([self.process_video_async(v) for v in unprocessed_videos], "Transcribing")
+        total += sum(results)
         
-        print(f"\n{'='*80}\nCOMPLETE - Processed {total} videos (new + retries)\n{'='*80}")
+        log.info(f"\n{'='*80}\nCOMPLETE - Processed {total} videos (new + retries)\n{'='*80}")
         
         if self.error_videos:
-            print(f"⚠️  {len(self.error_videos)} videos still have errors - run again to retry")
+            log.warning(f"⚠️  {len(self.error_videos)} videos still have errors - run again to retry")
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(), format='%(asctime)s %(message)s')
     YouTubeCreatorEconomyAutomation().run()